@@ -0,0 +1,130 @@
+'''
+Headless stand-ins for qtile windows and groups,
+used to drive SimpleDynamic without an X server.
+'''
+from libqtile.config import ScreenRect
+from libqtile.window import Window
+
+
+class HeadlessXWindow:
+
+    def __init__(self, wid, wm_class, role=None):
+        self.wid = wid
+        self.wm_class = wm_class
+        self.role = role
+
+    def get_wm_class(self):
+        return self.wm_class
+
+    def get_wm_window_role(self):
+        return self.role
+
+
+class HeadlessWindow(Window):
+    '''
+    Window which records its geometry instead of talking to X
+    '''
+
+    # shadow the X backed properties of Window
+    fullscreen = False
+    floating = False
+
+    def __init__(self, wid, wm_class=('term', 'Term'), name='', role=None):
+        self.window = HeadlessXWindow(wid, wm_class, role)
+        self.name = name
+        self.x = 0
+        self.y = 0
+        self.width = 0
+        self.height = 0
+        self.hidden = True
+        self.requests = 0
+
+    def place(self, x, y, width, height, borderwidth, bordercolor,
+            above=False, force=False, margin=None):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.requests += 1
+
+    def hide(self):
+        self.hidden = True
+        self.requests += 1
+
+    def unhide(self):
+        self.hidden = False
+        self.requests += 1
+
+    def __repr__(self):
+        return 'HeadlessWindow({})'.format(self.window.wid)
+
+
+class HeadlessScreen:
+
+    def __init__(self, width=1920, height=1080):
+        self.width = width
+        self.height = height
+
+    def get_rect(self):
+        return ScreenRect(0, 0, self.width, self.height)
+
+
+class HeadlessGroup:
+    '''
+    Minimal group, lays out all windows like qtile's group
+    '''
+
+    def __init__(self, name='1', screen=None):
+        self.name = name
+        self.screen = screen or HeadlessScreen()
+        self.qtile = None
+        self.windows = []
+        self.layout = None
+        self.current_window = None
+
+    def layout_all(self, warp=False):
+        if self.screen and self.windows:
+            self.layout.layout(self.windows, self.screen.get_rect())
+
+    def focus(self, win, warp=True):
+        if win is None or win not in self.windows:
+            return
+        self.current_window = win
+        self.layout.focus(win)
+        self.layout_all(warp)
+
+    def add(self, win):
+        self.windows.append(win)
+        self.layout.add(win)
+        self.focus(win)
+
+    def remove(self, win):
+        self.windows.remove(win)
+        self.layout.remove(win)
+        if self.current_window is win:
+            self.current_window = None
+
+
+class HeadlessConnection:
+
+    def flush(self):
+        pass
+
+
+class HeadlessQtile:
+    '''
+    Enough of qtile for layouts which draw their own windows
+    '''
+
+    def __init__(self):
+        self.conn = HeadlessConnection()
+        self.windows_map = {}
+        self._restart = False
+
+
+def headless_layout(layout, name='1', screen=None, qtile=None):
+    # return clone of layout attached to a new headless group
+    group = HeadlessGroup(name, screen)
+    group.qtile = qtile
+    group.layout = layout.clone(group)
+    return group.layout
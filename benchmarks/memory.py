@@ -0,0 +1,89 @@
+'''
+Memory benchmark for long sessions
+
+Runs rounds of window churn, shuffles, resizes and yaml template switches
+with the cyclic garbage collector disabled and reports per round:
+- layouts in the tree and layouts alive (the rest is held by undo history)
+- window wrappers alive
+- objects only the cyclic garbage collector could free
+- memory retained since the start
+
+Usage: python -m benchmarks.memory [rounds]
+'''
+import contextlib
+import gc
+import io
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+from simpledynamicqtile import DynamicBaseLayout, SimpleDynamic, WindowWrapper
+from benchmarks.headless import HeadlessWindow, headless_layout
+
+WINDOWS_PER_ROUND = 12
+SHUFFLES_PER_ROUND = 40
+
+
+def count_instances(cls):
+    return sum(1 for o in gc.get_objects() if isinstance(o, cls))
+
+
+def tree_size(layout):
+    return 1 + sum(tree_size(client) for client in layout.clients
+                   if isinstance(client, DynamicBaseLayout))
+
+
+def session_round(layout, rng, next_wid, template_file):
+    group = layout.group
+    for _ in range(WINDOWS_PER_ROUND):
+        group.add(HeadlessWindow(next_wid))
+        next_wid += 1
+    commands = [
+        layout.cmd_shuffle_left, layout.cmd_shuffle_right,
+        layout.cmd_shuffle_up, layout.cmd_shuffle_down,
+        layout.cmd_focus_left, layout.cmd_focus_right,
+        layout.cmd_focus_up, layout.cmd_focus_down]
+    for _ in range(SHUFFLES_PER_ROUND):
+        rng.choice(commands)()
+    layout.cmd_resize(rng.randint(-50, 50), rng.randint(-50, 50))
+    layout.cmd_save_yaml(template_file)
+    layout.cmd_load_yaml(template_file)
+    # close half of the windows
+    for window in rng.sample(group.windows, len(group.windows) // 2):
+        group.remove(window)
+    return next_wid
+
+
+def main(rounds=50):
+    rng = random.Random(0)
+    layout = headless_layout(SimpleDynamic())
+    fd, template_file = tempfile.mkstemp(suffix='.yaml')
+    os.close(fd)
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    next_wid = 1
+    print('{:>5} {:>8} {:>8} {:>8} {:>8} {:>10}'.format(
+        'round', 'tree', 'layouts', 'windows', 'cyclic', 'retained'))
+    try:
+        for index in range(1, rounds + 1):
+            with contextlib.redirect_stdout(io.StringIO()):
+                next_wid = session_round(layout, rng, next_wid, template_file)
+            layouts = count_instances(DynamicBaseLayout)
+            wrappers = count_instances(WindowWrapper)
+            cyclic = gc.collect()
+            retained = tracemalloc.get_traced_memory()[0] - baseline
+            print('{:>5} {:>8} {:>8} {:>8} {:>8} {:>9}K'.format(
+                index, tree_size(layout) - 1, layouts, wrappers, cyclic,
+                retained // 1024))
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+        os.remove(template_file)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,514 @@
+'''
+Differential test of the optimized layout paths
+
+Runs a random command stream against three headless engines:
+- SimpleDynamic, the optimized engine
+- ReferenceDynamic, which replaces the indexes, caches, shared undo
+  snapshots, lazy templates and incremental relayouts of SimpleDynamic
+  with tree walks, trees rebuilt from plain data and full relayouts
+- SimpleDynamic with tab bars, drawn by a bar which records its tabs
+
+After every command the trees, focus paths and window geometry of the
+first two have to be identical, and every visible tabs layout of the
+third has to show a bar with its current titles. A restart command
+saves the tree, rebuilds the engines and adds the windows back in
+random order, which has to give the tree from before.
+At the end the time per command is reported.
+
+Usage: python -m benchmarks.oracle [steps] [seed]
+'''
+import collections
+import contextlib
+import io
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import simpledynamicqtile
+from simpledynamicqtile import (
+    DynamicBaseLayout, GridLayout, PlacementRule, Rect, SimpleDynamic,
+    TabBar, TabsLayout, WindowWrapper, layout_classes, parse_class_name)
+from libqtile.layout.base import Layout
+from benchmarks.headless import HeadlessQtile, HeadlessWindow, headless_layout
+
+# () is a window without WM_CLASS
+WINDOW_CLASSES = [
+    ('term', 'Term'), ('browser', 'Browser'), ('editor', 'Editor'), ()]
+CLASS_NAMES = ['term', 'Term', 'browser', 'Browser', 'editor', 'Editor']
+TITLES = ['shell', 'Shell two', 'notes', 'mail', 'news', 'news feed']
+TAGS = ['side', 'web']
+PLACEMENT_RULES = [
+    PlacementRule('side', wm_class='Editor'),
+    PlacementRule('web', title=re.compile('news|mail'))]
+TEMPLATE = [{'HorizontalLayout': [
+    {'TabsLayout': [{'class_name': 'editor - Editor'}], 'tag': 'side'},
+    {'TabsLayout': [{'class_name': 'browser - Browser'}]}]}]
+TAB_BAR_HEIGHT = 20
+WINDOWS = 30
+
+# operation names with weights
+OPERATIONS = [
+    ('add', 6), ('remove', 5), ('focus', 6), ('rename', 3),
+    ('focus_left', 3), ('focus_right', 3), ('focus_up', 3),
+    ('focus_down', 3), ('shuffle_left', 3), ('shuffle_right', 3),
+    ('shuffle_up', 3), ('shuffle_down', 3), ('resize', 2),
+    ('reset_size', 1), ('grid', 1), ('tag', 1), ('undo', 2), ('redo', 1),
+    ('focus_last', 2), ('focus_by_class', 2), ('focus_by_title', 2),
+    ('save_load', 1), ('restart', 1)]
+
+# command lists run on new engines before the random stream
+SCENARIOS = [
+    # undo after the resized neighbour of a window was closed
+    [('add', (1, ('term', 'Term'), 'shell')),
+     ('add', (2, ('term', 'Term'), 'notes')),
+     ('shuffle_right', ()), ('resize', (-200, 0)), ('remove', (2,)),
+     ('undo', ())],
+    # undo after a window filled the free editor place and closed
+    [('add', (1, ('term', 'Term'), 'shell')), ('reset_size', ()),
+     ('add', (2, ('editor', 'Editor'), 'notes')), ('remove', (2,)),
+     ('undo', ())]]
+
+
+class ReferenceDynamic(SimpleDynamic):
+    '''
+    SimpleDynamic without indexes, caches, sharing and batching
+    '''
+
+    def clone(self, group):
+        c = SimpleDynamic.clone(self, group)
+        # build the template from its tree right away
+        # instead of copying the parsed one on first use
+        if c.pending_template:
+            c.build(c, self.template, 0, {})
+        return c
+
+    def layout(self, windows, screen):
+        # grid cells computed from scratch,
+        # every window configured and sent one by one
+        for grid in self.grid_layouts(self):
+            grid.cells_key = None
+        Layout.layout(self, windows, screen)
+
+    def grid_layouts(self, layout):
+        for client in layout.clients:
+            if isinstance(client, DynamicBaseLayout):
+                if isinstance(client, GridLayout):
+                    yield client
+                yield from self.grid_layouts(client)
+
+    def snapshot(self):
+        # the tree as plain data, nothing shared with other snapshots,
+        # free places are entries without window id
+        rect = self.rect and (
+            self.rect.x, self.rect.y, self.rect.width, self.rect.height)
+        return self.client_focus, rect, self.to_tree(self, True)
+
+    def apply_snapshot(self, snapshot):
+        # rebuild the tree from its data, then lay out everything
+        focused_client = self.focused_client()
+        wrappers = {}
+        for client in self.all_windows():
+            if client.window:
+                wrappers[client.window.window.wid] = client
+        focus, rect, tree = snapshot
+        self.rect = Rect(*rect) if rect else None
+        closed = self.build(self, tree, focus, wrappers)
+        # windows opened after the snapshot was taken
+        for client in wrappers.values():
+            if len(self.clients) == 0:
+                layout = self.default_layout()
+                layout.root_layout = self
+                DynamicBaseLayout.add(self, layout)
+            self.focused_layout().add(client)
+        self.cleanup()
+        # sizes were saved next to the closed windows
+        if closed:
+            self.reset_size()
+        self.clear_index()
+        for client in self.all_windows():
+            if client.window:
+                self.index_window(client)
+        self.group.layout_all()
+        client = self.focused_client()
+        if client and client != focused_client:
+            self.group.focus(client.window, True)
+
+    def build(self, layout, tree, focus, wrappers):
+        # set the clients of layout from tree data, open windows keep
+        # their wrappers, returns True if a closed window was dropped,
+        # templates have no focus and no window ids
+        closed = False
+        layout.clients = []
+        layout.client_focus = focus
+        for index, sub_tree in enumerate(tree):
+            if 'class_name' not in sub_tree:
+                name = next(iter(sub_tree))
+                client = layout_classes[name]()
+                client.root_layout = self
+                rect = sub_tree.get('rect')
+                client.rect = rect and Rect(
+                    rect['x'], rect['y'], rect['width'], rect['height'])
+                if isinstance(client, GridLayout):
+                    # copied, the sizes change in place
+                    for sizes in ('column_sizes', 'row_sizes'):
+                        if sizes in sub_tree:
+                            setattr(client, sizes, list(sub_tree[sizes]))
+                if 'tag' in sub_tree:
+                    self.tag_layout(client, sub_tree['tag'])
+                closed = self.build(
+                    client, sub_tree[name], sub_tree.get('focus', 0),
+                    wrappers) or closed
+            elif 'wid' not in sub_tree:
+                client = WindowWrapper(None)
+                client.wm_class = parse_class_name(sub_tree['class_name'])
+            elif sub_tree['wid'] in wrappers:
+                client = wrappers.pop(sub_tree['wid'])
+            else:
+                closed = True
+                if index < focus:
+                    layout.client_focus -= 1
+                continue
+            client.parent = layout
+            layout.clients.append(client)
+        layout.client_focus = max(
+            0, min(layout.client_focus, len(layout.clients) - 1))
+        return closed
+
+    def focus(self, client):
+        if self.restore_pending:
+            return
+        for wrapper in self.all_windows():
+            if wrapper.window is client:
+                client = wrapper
+                break
+        DynamicBaseLayout.focus(self, client)
+        self.remember_focus(self.focused_client())
+
+    def placement_layout(self, client):
+        properties = {
+            'wm_class': client.window.get_wm_class() or (),
+            'role': client.window.get_wm_window_role(),
+            'title': client.name
+        }
+        for rule in self.placement_rules:
+            if rule.match(properties):
+                return self.tagged_layout(rule.tag)
+
+    def tagged_layout(self, tag):
+        layouts = [self]
+        while layouts:
+            layout = layouts.pop(0)
+            if layout is not self and layout.tag == tag:
+                return layout
+            layouts.extend(client for client in layout.clients
+                           if isinstance(client, DynamicBaseLayout))
+
+    def cmd_focus_by_class(self, wm_class):
+        # windows found by a tree walk, in the order of the class index
+        order = {window: index for index, window
+                 in enumerate(self.class_index.get(wm_class, ()))}
+        self.focus_window_of(sorted(
+            (client.window for client in self.all_windows()
+                if client.window and wm_class in (client.wm_class or ())),
+            key=lambda window: order[window]))
+
+    def cmd_focus_by_title(self, title):
+        self.focus_window_of(sorted(
+            (client.window for client in self.all_windows()
+                if client.window and (client.window.name or '').lower()
+                .startswith(title.lower())),
+            key=lambda window: (
+                (window.name or '').lower(), window.window.wid)))
+
+
+class RecordingPanel:
+
+    def __init__(self):
+        self.hidden = True
+
+    def hide(self):
+        self.hidden = True
+
+    def unhide(self):
+        self.hidden = False
+
+
+class RecordingTabBar(TabBar):
+    '''
+    Tab bar which records the tabs it draws instead of drawing them
+    '''
+
+    def __init__(self, qtile, config):
+        TabBar.__init__(self, qtile, config)
+        # tab index to title and focus as last drawn
+        self.drawn = {}
+
+    def resize(self, rect):
+        if not self.panel:
+            self.panel = RecordingPanel()
+        if not self.rect or self.rect[2:] != rect[2:]:
+            self.titles = []
+            self.drawn = {}
+        self.rect = rect
+
+    def draw_tab(self, index, focused):
+        self.drawn[index] = (self.titles[index], focused)
+
+    def kill(self):
+        self.panel = None
+
+
+class TabBarDynamic(SimpleDynamic):
+
+    tab_bar_class = RecordingTabBar
+
+
+class Engine:
+
+    def __init__(self, layout_class, template_file, qtile=None, **config):
+        self.prototype = layout_class(placement_rules=PLACEMENT_RULES,
+                template=TEMPLATE, **config)
+        self.qtile = qtile
+        self.layout = headless_layout(self.prototype, qtile=qtile)
+        self.windows = {}
+        self.template_file = template_file
+        self.times = collections.defaultdict(float)
+
+    def run(self, name, args):
+        # return problem found by the command itself or None
+        layout = self.layout
+        group = layout.group
+        problem = None
+        start = time.perf_counter()
+        if name == 'add':
+            wid, wm_class, title = args
+            self.windows[wid] = HeadlessWindow(wid, wm_class, title)
+            group.add(self.windows[wid])
+        elif name == 'remove':
+            group.remove(self.windows.pop(args[0]))
+        elif name == 'focus':
+            group.focus(self.windows[args[0]], True)
+        elif name == 'rename':
+            window = self.windows[args[0]]
+            window.name = args[1]
+            simpledynamicqtile.update_titles(window)
+        elif name == 'save_load':
+            layout.cmd_save_yaml(self.template_file)
+            layout.cmd_load_yaml(self.template_file)
+        elif name == 'restart':
+            problem = self.restart(args[0])
+        else:
+            getattr(layout, 'cmd_' + name)(*args)
+        self.times[name] += time.perf_counter() - start
+        return problem
+
+    def restart(self, order):
+        # save, start a new layout and add the windows back in order
+        before = self.state()
+        state = self.layout.restart_state()
+        simpledynamicqtile.root_layouts.discard(self.layout)
+        simpledynamicqtile.restart_trees = {'1': {0: state}}
+        self.layout = headless_layout(self.prototype, qtile=self.qtile)
+        group = self.layout.group
+        windows = {}
+        for wid in order:
+            window = self.windows[wid]
+            windows[wid] = HeadlessWindow(
+                    wid, window.window.wm_class, window.name)
+            group.add(windows[wid])
+        self.windows = windows
+        self.layout.finish_restore()
+        after = self.state()
+        # qtile's current window follows the saved focus after restart
+        for part in ('tree', 'focus path', 'geometry'):
+            value = before[part]
+            if after[part] != value:
+                return 'restart changed the {}\nbefore: {}\nafter: {}'.format(
+                    part, value, after[part])
+
+    def state(self):
+        # everything the engines have to agree on
+        layout = self.layout
+        focus_path = []
+        client = layout
+        while isinstance(client, DynamicBaseLayout) and client.clients:
+            focus_path.append(client.client_focus)
+            client = client.clients[client.client_focus]
+        geometry = {}
+        for wid, window in self.windows.items():
+            geometry[wid] = (window.hidden,) if window.hidden else \
+                    (window.hidden, window.x, window.y,
+                     window.width, window.height)
+        current_window = layout.group.current_window
+        return {
+            'tree': layout.to_tree(layout, True),
+            'focus path': focus_path,
+            'geometry': geometry,
+            'current window':
+                current_window.window.wid if current_window else None
+        }
+
+
+def tab_title(client):
+    if isinstance(client, DynamicBaseLayout):
+        client = client.focused_client()
+    if not client:
+        return ''
+    if client.window:
+        return client.window.name or ''
+    return simpledynamicqtile.class_name(client.wm_class)
+
+
+def has_windows(layout):
+    return any(client.window for client in layout.all_windows())
+
+
+def check_removed_tab_bars(layout):
+    # return problem if tabs which left the tree kept their bar
+    for tabs, tab_bar in layout.tab_bars.items():
+        if not tabs.is_attached() and tab_bar.panel:
+            return 'bar kept for removed tabs'
+
+
+def check_tab_bars(layout, visible=True):
+    # return problem with the bars of tabs below layout or None
+    for index, client in enumerate(layout.clients):
+        if not isinstance(client, DynamicBaseLayout):
+            continue
+        client_visible = visible and (not isinstance(layout, TabsLayout) or
+                                      index == layout.client_focus)
+        tab_bar = layout.root_layout.tab_bars.get(client)
+        if isinstance(client, TabsLayout) and client_visible and \
+                has_windows(client):
+            titles = [tab_title(tab) for tab in client.clients]
+            expected = {index: (title, index == client.client_focus)
+                        for index, title in enumerate(titles)}
+            rect = (client.rect.x, client.rect.y,
+                    client.rect.width, TAB_BAR_HEIGHT)
+            if not tab_bar or not tab_bar.panel or tab_bar.panel.hidden:
+                return 'no bar for visible tabs {}'.format(titles)
+            if tab_bar.rect != rect:
+                return 'bar at {} for tabs at {}'.format(tab_bar.rect, rect)
+            drawn = {index: tab_bar.drawn.get(index) for index in expected}
+            if drawn != expected:
+                return 'bar shows {} for tabs {}'.format(drawn, expected)
+        elif tab_bar and tab_bar.panel and not tab_bar.panel.hidden and \
+                not client_visible:
+            return 'bar shown for hidden tabs'
+        problem = check_tab_bars(client, client_visible)
+        if problem:
+            return problem
+
+
+def random_operation(rng, windows, next_wid):
+    # return name and arguments of a random operation
+    names, weights = zip(*OPERATIONS)
+    if len(windows) < 2:
+        name = 'add'
+    elif len(windows) >= WINDOWS:
+        name = 'remove'
+    else:
+        name = rng.choices(names, weights)[0]
+    if name == 'add':
+        return name, (next_wid, rng.choice(WINDOW_CLASSES), rng.choice(TITLES))
+    if name in ('remove', 'focus'):
+        return name, (rng.choice(windows),)
+    if name == 'rename':
+        return name, (rng.choice(windows), rng.choice(TITLES))
+    if name == 'resize':
+        return name, (rng.randint(-80, 80), rng.randint(-80, 80))
+    if name == 'tag':
+        return name, (rng.choice(TAGS), rng.randint(0, 2))
+    if name == 'focus_by_class':
+        return name, (rng.choice(CLASS_NAMES),)
+    if name == 'focus_by_title':
+        title = rng.choice(TITLES)
+        return name, (title[:rng.randint(1, len(title))].upper(),)
+    if name == 'restart':
+        return name, (rng.sample(windows, len(windows)),)
+    return name, ()
+
+
+def compare(reference, optimized):
+    # return first differing part of the state or None
+    reference_state = reference.state()
+    optimized_state = optimized.state()
+    for name, value in reference_state.items():
+        if optimized_state[name] != value:
+            return '{} differs\nreference: {}\noptimized: {}'.format(
+                name, value, optimized_state[name])
+
+
+def engines(files):
+    return (Engine(ReferenceDynamic, files[0]),
+            Engine(SimpleDynamic, files[1]),
+            Engine(TabBarDynamic, files[2], HeadlessQtile(),
+                tab_bar_height=TAB_BAR_HEIGHT))
+
+
+def run_step(engines, name, args):
+    # run a command on all engines, return engine and problem or None
+    reference, optimized, tab_bars = engines
+    with contextlib.redirect_stdout(io.StringIO()):
+        problems = [
+            ('reference', reference.run(name, args)),
+            ('optimized', optimized.run(name, args)),
+            ('tab bars', tab_bars.run(name, args)),
+            ('reference and optimized', compare(reference, optimized)),
+            ('tab bars', check_tab_bars(tab_bars.layout)),
+            ('tab bars', check_removed_tab_bars(tab_bars.layout))]
+    for engine, problem in problems:
+        if problem:
+            return engine, problem
+
+
+def main(steps=2000, seed=0):
+    rng = random.Random(seed)
+    files = []
+    for _ in range(3):
+        fd, file_name = tempfile.mkstemp(suffix='.yaml')
+        os.close(fd)
+        files.append(file_name)
+    counts = collections.Counter()
+    next_wid = 1
+    try:
+        for index, scenario in enumerate(SCENARIOS):
+            scenario_engines = engines(files)
+            for step, (name, args) in enumerate(scenario, 1):
+                problem = run_step(scenario_engines, name, args)
+                if problem:
+                    print('scenario {} step {}: {}{}, {}: {}'.format(
+                        index, step, name, args, *problem))
+                    return 1
+        reference, optimized, tab_bars = all_engines = engines(files)
+        for step in range(1, steps + 1):
+            name, args = random_operation(
+                    rng, sorted(optimized.windows), next_wid)
+            if name == 'add':
+                next_wid += 1
+            counts[name] += 1
+            problem = run_step(all_engines, name, args)
+            if problem:
+                print('step {}: {}{}, {}: {}'.format(
+                    step, name, args, *problem))
+                return 1
+    finally:
+        for file_name in files:
+            os.remove(file_name)
+    print('{} steps, seed {}, no differences'.format(steps, seed))
+    print('{:<16} {:>6} {:>14} {:>14} {:>8}'.format(
+        'operation', 'count', 'reference us', 'optimized us', 'speedup'))
+    for name, count in sorted(counts.items()):
+        reference_time = reference.times[name] / count * 1e6
+        optimized_time = optimized.times[name] / count * 1e6
+        print('{:<16} {:>6} {:>14.1f} {:>14.1f} {:>7.2f}x'.format(
+            name, count, reference_time, optimized_time,
+            reference_time / optimized_time if optimized_time else 0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*map(int, sys.argv[1:])))
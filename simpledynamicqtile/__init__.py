@@ -1,7 +1,15 @@
+import bisect
+import collections
+import math
+import os
+import tempfile
 import textwrap
+import weakref
 import yaml
+from libqtile import drawer, hook
 from libqtile.layout.base import Layout
-from libqtile.window import Window
+from libqtile.log_utils import logger
+from libqtile.window import Internal, Window
 from libqtile.config import ScreenRect
 
 class Rect:
@@ -20,11 +28,24 @@ class WindowWrapper:
 
     def __init__(self, window=None):
         self.window = window
+        # id of the window before a restart, only set on free wrappers
+        self.wid = None
+        self.parent = None
         if self.window:
             self.wm_class = window.window.get_wm_class()
         else:
             self.wm_class = None
 
+    # layout containing this window, weak like the parent of layouts
+
+    @property
+    def parent(self):
+        return self._parent() if self._parent else None
+
+    @parent.setter
+    def parent(self, parent):
+        self._parent = weakref.ref(parent) if parent is not None else None
+
     def __eq__(self, other):
         if isinstance(other, self.__class__):
             return self.window == other.window
@@ -41,6 +62,174 @@ class WindowWrapper:
         return 'WindowWrapper({}, wm_class={})'.format(
                 str(self.window), self.wm_class)
 
+
+# wm_class is empty for windows without WM_CLASS
+
+def class_name(wm_class):
+    return ' - '.join(wm_class or ())
+
+def parse_class_name(name):
+    return tuple(name.split(' - ')) if name else ()
+
+class WindowSnapshot:
+    '''
+    Immutable copy of a window wrapper, window is None for a free place.
+    Wrappers change when a window fills their place,
+    so snapshots keep the values instead.
+    '''
+
+    __slots__ = ('window', 'wm_class', 'wid')
+
+    def __init__(self, window, wm_class, wid=None):
+        self.window = window
+        self.wm_class = wm_class
+        self.wid = wid
+
+    def __eq__(self, other):
+        return isinstance(other, WindowSnapshot) and \
+                self.window is other.window and \
+                self.wm_class == other.wm_class and \
+                self.wid == other.wid
+
+    def __hash__(self):
+        return hash((id(self.window), self.wm_class, self.wid))
+
+    def __str__(self):
+        return 'WindowSnapshot({}, wm_class={})'.format(
+                str(self.window), self.wm_class)
+
+class LayoutSnapshot:
+    '''
+    Immutable copy of a layout node.
+    Clients are window snapshots or snapshots of child layouts.
+    Consecutive snapshots share nodes of unchanged subtrees.
+    '''
+
+    __slots__ = ('layout', 'layout_class', 'rect', 'state', 'client_focus',
+            'clients', 'tag')
+
+    def __init__(self, layout, layout_class, rect, state, client_focus,
+            clients, tag=None):
+        self.layout = layout
+        self.layout_class = layout_class
+        self.rect = rect
+        self.state = state
+        self.client_focus = client_focus
+        self.clients = clients
+        self.tag = tag
+
+    def matches(self, layout_class, rect, state, client_focus, clients, tag):
+        # true if this snapshot holds the given state,
+        # child layout snapshots are compared by identity,
+        # window snapshots by value
+        if self.layout_class is not layout_class or \
+                self.rect != rect or \
+                self.state != state or \
+                self.tag != tag or \
+                self.client_focus != client_focus or \
+                len(self.clients) != len(clients):
+            return False
+        for own_client, client in zip(self.clients, clients):
+            if own_client != client:
+                return False
+        return True
+
+    def __str__(self):
+        result = 'LayoutSnapshot({}, rect={})'.format(
+                self.layout_class.__name__, self.rect)
+        clients_result = '\n'.join(map(str, self.clients))
+        clients_result = textwrap.indent(clients_result, '  ')
+        if len(clients_result) > 0:
+            result += '\n' + clients_result
+        return result
+
+class PlacementRule:
+    '''
+    New windows matching all given properties are put into
+    the container tagged with tag.
+    Properties are strings for exact matches or compiled regular expressions,
+    wm_class matches instance or class name.
+    '''
+
+    def __init__(self, tag, wm_class=None, role=None, title=None):
+        self.tag = tag
+        self.properties = {}
+        if wm_class is not None:
+            self.properties['wm_class'] = wm_class
+        if role is not None:
+            self.properties['role'] = role
+        if title is not None:
+            self.properties['title'] = title
+
+    def is_exact(self):
+        for value in self.properties.values():
+            if not isinstance(value, str):
+                return False
+        return True
+
+    def match(self, properties):
+        # properties maps property names to the values of a window,
+        # wm_class to a tuple of instance and class name
+        for name, value in self.properties.items():
+            values = properties[name]
+            if name != 'wm_class':
+                values = (values,)
+            if isinstance(value, str):
+                if value not in values:
+                    return False
+            elif not any(v is not None and value.match(v) for v in values):
+                return False
+        return True
+
+    def __str__(self):
+        return 'PlacementRule({}, {})'.format(self.tag, self.properties)
+
+class PlacementRules:
+    '''
+    Placement rules compiled into a dispatch table.
+    Exact rules are found by hashing their first property,
+    rules with regular expressions are tried after that.
+    The first matching rule in the given order wins.
+    '''
+
+    def __init__(self, rules):
+        self.table = {}
+        self.patterns = []
+        for index, rule in enumerate(rules):
+            if rule.is_exact() and rule.properties:
+                name = next(iter(rule.properties))
+                key = (name, rule.properties[name])
+                self.table.setdefault(key, []).append((index, rule))
+            else:
+                self.patterns.append((index, rule))
+
+    def match(self, window):
+        # return first rule matching window or None
+        properties = {
+            'wm_class': window.window.get_wm_class() or (),
+            'role': window.window.get_wm_window_role(),
+            'title': window.name
+        }
+        result = None
+        keys = [('wm_class', wm_class) for wm_class in properties['wm_class']]
+        keys.append(('role', properties['role']))
+        keys.append(('title', properties['title']))
+        for key in keys:
+            for index, rule in self.table.get(key, ()):
+                if result and result[0] < index:
+                    break
+                if rule.match(properties):
+                    result = (index, rule)
+                    break
+        for index, rule in self.patterns:
+            if result and result[0] < index:
+                break
+            if rule.match(properties):
+                result = (index, rule)
+                break
+        if result:
+            return result[1]
+
 '''
 Windows are leaves
 up/left is previous
@@ -56,6 +245,8 @@ class DynamicBaseLayout(Layout):
         self.rect = None
         self.redraw = False
         self.root_layout = None
+        # name used by placement rules
+        self.tag = None
 
     def clone(self, group):
         c = Layout.clone(self, group)
@@ -67,6 +258,27 @@ class DynamicBaseLayout(Layout):
         c.root_layout = self.root_layout
         return c
 
+    # parent and root_layout are weak references,
+    # so the tree has no reference cycles and
+    # removed subtrees are freed as soon as they are dropped
+
+    @property
+    def parent(self):
+        return self._parent() if self._parent else None
+
+    @parent.setter
+    def parent(self, parent):
+        self._parent = weakref.ref(parent) if parent is not None else None
+
+    @property
+    def root_layout(self):
+        return self._root_layout() if self._root_layout else None
+
+    @root_layout.setter
+    def root_layout(self, root_layout):
+        self._root_layout = weakref.ref(root_layout) \
+                if root_layout is not None else None
+
     def add(self, client):
         if client in self.clients:
             return
@@ -80,8 +292,11 @@ class DynamicBaseLayout(Layout):
             direct_parent.root_layout = self.root_layout
             self.clients.insert(self.client_focus + 1, direct_parent)
             direct_parent.clients = [client]
+            client.parent = direct_parent
         else:
             self.clients.insert(self.client_focus + 1, client)
+            if isinstance(client, WindowWrapper):
+                client.parent = self
         self.focus(client)
         return client 
 
@@ -98,8 +313,11 @@ class DynamicBaseLayout(Layout):
             direct_parent.root_layout = self.root_layout
             self.clients.insert(0, direct_parent)
             direct_parent.clients = [client]
+            client.parent = direct_parent
         else:
             self.clients.insert(0, client)
+            if isinstance(client, WindowWrapper):
+                client.parent = self
         self.focus(client)
         return client
 
@@ -116,8 +334,11 @@ class DynamicBaseLayout(Layout):
             direct_parent.root_layout = self.root_layout
             self.clients.append(direct_parent)
             direct_parent.clients = [client]
+            client.parent = direct_parent
         else:
             self.clients.append(client)
+            if isinstance(client, WindowWrapper):
+                client.parent = self
         self.focus(client)
         return client
 
@@ -279,10 +500,20 @@ class DynamicBaseLayout(Layout):
         horizontal_layout = None
         while (vertical_layout is None or horizontal_layout is None) and \
                 layout.parent:
-            if isinstance(layout, VerticalLayout) and not vertical_layout:
+            # tagged layouts may be kept with a single client,
+            # those have nothing to resize
+            if isinstance(layout, VerticalLayout) and not vertical_layout \
+                    and len(layout.clients) > 1:
                 vertical_layout = layout
-            if isinstance(layout, HorizontalLayout) and not horizontal_layout:
+            if isinstance(layout, HorizontalLayout) and \
+                    not horizontal_layout and len(layout.clients) > 1:
                 horizontal_layout = layout
+            if isinstance(layout, GridLayout):
+                # grids resize rows and columns
+                if not vertical_layout:
+                    vertical_layout = layout
+                if not horizontal_layout:
+                    horizontal_layout = layout
             layout = layout.parent
         if vertical_layout:
             vertical_layout.resize(0, y)
@@ -327,7 +558,9 @@ class DynamicBaseLayout(Layout):
         for leaf in self.leaf_layouts():
             node = leaf
             while node != node.root_layout:
-                if not isinstance(node, self.root_layout.default_layout):
+                # tagged layouts stay as placement targets
+                if not isinstance(node, self.root_layout.default_layout) and \
+                        node.tag is None:
                     if len(node.clients) == 1:
                         node.parent.replace(node, node.clients[0])
                 node = node.parent
@@ -371,6 +604,7 @@ class DynamicBaseLayout(Layout):
         for client in self.clients:
             if isinstance(client, WindowWrapper) and \
                     client.window is None and \
+                    client.wid is None and \
                     client.wm_class == wm_class:
                 return client
             elif isinstance(client, DynamicBaseLayout):
@@ -419,6 +653,145 @@ class DynamicBaseLayout(Layout):
     def is_root(self):
         return self.parent == None
 
+    def is_attached(self):
+        # true if this layout is part of the tree of its root
+        layout = self
+        while layout.parent:
+            if layout not in layout.parent.clients:
+                return False
+            layout = layout.parent
+        return layout == self.root_layout
+
+    def snapshot(self, previous, current):
+        # return snapshot of this layout
+        # previous maps layouts to snapshots of the last snapshot,
+        # unchanged nodes are reused from there and stored in current
+        clients = []
+        for client in self.clients:
+            if isinstance(client, DynamicBaseLayout):
+                clients.append(client.snapshot(previous, current))
+            else:
+                clients.append(WindowSnapshot(
+                        client.window, client.wm_class, client.wid))
+        clients = tuple(clients)
+        rect = None
+        if self.rect:
+            rect = (self.rect.x, self.rect.y, self.rect.width, self.rect.height)
+        state = self.layout_state()
+        result = previous.get(self)
+        if not result or not result.matches(
+                type(self), rect, state, self.client_focus, clients, self.tag):
+            # the root is restored in place, don't keep a reference to it
+            layout = None if self == self.root_layout else self
+            result = LayoutSnapshot(layout, type(self), rect, state,
+                    self.client_focus, clients, self.tag)
+        current[self] = result
+        return result
+
+    def restore(self, snapshot, windows):
+        # set state of this layout and its children from snapshot
+        # windows maps open windows to wrappers, closed ones are dropped,
+        # free places get new wrappers,
+        # returns True if a window was dropped
+        dropped = False
+        restored_windows = self.root_layout.restored_windows
+        self.rect = Rect(*snapshot.rect) if snapshot.rect else None
+        self.set_layout_state(snapshot.state)
+        self.tag = snapshot.tag
+        if self.tag is not None:
+            self.root_layout.tag_layout(self, self.tag)
+        self.clients = []
+        # focus stays on the focused client if its window is still open
+        client_focus = snapshot.client_focus
+        for index, client in enumerate(snapshot.clients):
+            if isinstance(client, LayoutSnapshot):
+                layout = client.layout
+                layout.parent = self
+                layout.root_layout = self.root_layout
+                dropped = layout.restore(client, windows) or dropped
+                self.clients.append(layout)
+            # places of windows from before a restart are dropped
+            # once their window is not expected any more
+            elif client.window is None and (client.wid is None or
+                    client.wid in restored_windows):
+                self.clients.append(self.free_place(client))
+            elif client.window in windows:
+                wrapper = windows.pop(client.window)
+                wrapper.parent = self
+                self.clients.append(wrapper)
+            else:
+                dropped = True
+                if index < snapshot.client_focus:
+                    client_focus -= 1
+        self.client_focus = max(0, min(client_focus, len(self.clients) - 1))
+        return dropped
+
+    def instantiate(self, snapshot):
+        # build a new copy of snapshot below this layout,
+        # windows become free window wrappers
+        self.rect = Rect(*snapshot.rect) if snapshot.rect else None
+        self.set_layout_state(snapshot.state)
+        self.clients = []
+        for client in snapshot.clients:
+            if isinstance(client, LayoutSnapshot):
+                layout = client.layout_class()
+                layout.parent = self
+                layout.root_layout = self.root_layout
+                if client.tag is not None:
+                    self.root_layout.tag_layout(layout, client.tag)
+                layout.instantiate(client)
+                self.clients.append(layout)
+            else:
+                self.clients.append(self.free_place(client))
+        self.client_focus = max(
+                0, min(snapshot.client_focus, len(self.clients) - 1))
+
+    def free_place(self, snapshot):
+        # return free window wrapper below this layout for window snapshot,
+        # places of windows from before a restart wait for their window
+        window = WindowWrapper(None)
+        window.wm_class = snapshot.wm_class
+        window.wid = snapshot.wid
+        if window.wid is not None:
+            self.root_layout.restored_windows[window.wid] = window
+        window.parent = self
+        return window
+
+    def remove_windows(self, windows):
+        # remove window wrappers, windows is a set of their ids
+        focused = self.clients[self.client_focus] if self.clients else None
+        self.clients = [client for client in self.clients
+                        if id(client) not in windows]
+        for index, client in enumerate(self.clients):
+            if isinstance(client, DynamicBaseLayout):
+                client.remove_windows(windows)
+            if client is focused:
+                self.client_focus = index
+        self.client_focus = max(
+                0, min(self.client_focus, len(self.clients) - 1))
+
+    def layout_state(self):
+        # immutable state specific to the layout type
+        return None
+
+    def set_layout_state(self, state):
+        pass
+
+    def placements(self, path=()):
+        # map windows to everything their geometry depends on
+        result = {}
+        path = path + ((self, self.rect and (self.rect.x, self.rect.y,
+                self.rect.width, self.rect.height), self.layout_state(),
+                len(self.clients)),)
+        for index, client in enumerate(self.clients):
+            client_path = path + ((index, isinstance(self, TabsLayout) and \
+                    index == self.client_focus),)
+            if isinstance(client, DynamicBaseLayout):
+                result.update(client.placements(client_path))
+            elif client.window:
+                result[client.window] = client_path
+        return result
+
     def __str__(self):
         result = '{}(rect={})'.format(type(self).__name__, self.rect)
         clients_result = '\n'.join(map(str, self.clients))
@@ -440,14 +813,12 @@ class VerticalLayout(DynamicBaseLayout):
             client_wrapper = self.clients[index]
             if not client_wrapper.rect:
                 client_wrapper.rect = Rect(*self.window_size(index))
-            client.place(
-                client_wrapper.x,
-                client_wrapper.y,
-                client_wrapper.width,
-                client_wrapper.height,
-                0,
-                None)
-            client.unhide()
+            self.root_layout.place_client(
+                client,
+                client_wrapper.rect.x,
+                client_wrapper.rect.y,
+                client_wrapper.rect.width,
+                client_wrapper.rect.height)
         else:
             for index, layout in enumerate(self.clients):
                 if isinstance(layout, DynamicBaseLayout):
@@ -499,6 +870,10 @@ class VerticalLayout(DynamicBaseLayout):
     def resize(self, x, y):
         focused_layout = self.clients[self.client_focus]
         if focused_layout.rect:
+            # clients which were never laid out start at their default size
+            for index, client in enumerate(self.clients):
+                if not client.rect:
+                    client.rect = Rect(*self.window_size(index))
             if 0 < y and y < self.rect.height - focused_layout.rect.height:
                 focused_layout.rect.height += y
                 ratio = y / (self.rect.height - focused_layout.rect.height)
@@ -553,15 +928,13 @@ class HorizontalLayout(DynamicBaseLayout):
             index = self.clients.index(client)
             client_wrapper = self.clients[index]
             if not client_wrapper.rect:
-                client_wrapper.rect = Rect(self.window_size(index))
-            client.place(
-                client_wrapper.x,
-                client_wrapper.y,
-                client_wrapper.width,
-                client_wrapper.height,
-                0,
-                None)
-            client.unhide()
+                client_wrapper.rect = Rect(*self.window_size(index))
+            self.root_layout.place_client(
+                client,
+                client_wrapper.rect.x,
+                client_wrapper.rect.y,
+                client_wrapper.rect.width,
+                client_wrapper.rect.height)
         else:
             for index, layout in enumerate(self.clients):
                 if isinstance(layout, DynamicBaseLayout):
@@ -613,6 +986,10 @@ class HorizontalLayout(DynamicBaseLayout):
     def resize(self, x, y):
         focused_layout = self.clients[self.client_focus]
         if focused_layout.rect:
+            # clients which were never laid out start at their default size
+            for index, client in enumerate(self.clients):
+                if not client.rect:
+                    client.rect = Rect(*self.window_size(index))
             if 0 < x and x < self.rect.width - focused_layout.rect.width:
                 focused_layout.rect.width += x
                 ratio = x / (self.rect.width - focused_layout.rect.width)
@@ -655,20 +1032,368 @@ class HorizontalLayout(DynamicBaseLayout):
         else:
             return DynamicBaseLayout.right_layout(self)
 
+class GridLayout(DynamicBaseLayout):
+    '''
+    Grid layout
+    clients are placed row by row,
+    all cell rects are computed at once
+    '''
+
+    def __init__(self, **config):
+        DynamicBaseLayout.__init__(self, **config)
+        self.column_sizes = None
+        self.row_sizes = None
+        self.cells = []
+        self.cells_key = None
+
+    def configure(self, client, screen):
+        if not self.rect:
+            self.rect = Rect(screen.x, screen.y, screen.width, screen.height)
+        cells = self.cell_rects()
+        if client in self.clients:
+            index = self.clients.index(client)
+            self.root_layout.place_client(client, *cells[index])
+        else:
+            for index, layout in enumerate(self.clients):
+                if isinstance(layout, DynamicBaseLayout):
+                    if layout.client_layout(client):
+                        layout.configure(client, ScreenRect(*cells[index]))
+
+    def grid_size(self):
+        # return number of columns and rows
+        if len(self.clients) == 0:
+            return 0, 0
+        columns = int(math.ceil(math.sqrt(len(self.clients))))
+        rows = int(math.ceil(len(self.clients) / columns))
+        return columns, rows
+
+    def cell_rects(self):
+        # return rects of all cells, recomputed only if the grid changed
+        # children get the rects of their cells, so the key holds them all
+        key = (self.rect.x, self.rect.y, self.rect.width, self.rect.height,
+                tuple(map(id, self.clients)), self.layout_state())
+        if key == self.cells_key:
+            return self.cells
+        columns, rows = self.grid_size()
+        column_edges = self.edges(
+                self.rect.x, self.rect.width, self.column_sizes, columns)
+        row_edges = self.edges(
+                self.rect.y, self.rect.height, self.row_sizes, rows)
+        self.cells = [
+            (column_edges[column],
+             row_edges[row],
+             column_edges[column + 1] - column_edges[column],
+             row_edges[row + 1] - row_edges[row])
+            for row, column in (divmod(index, columns)
+                for index in range(len(self.clients)))]
+        self.cells_key = key
+        # children follow their cells, sizes inside a moved child are reset
+        for client, cell in zip(self.clients, self.cells):
+            if isinstance(client, DynamicBaseLayout):
+                rect = client.rect
+                if not rect or (rect.x, rect.y, rect.width, rect.height) != cell:
+                    client.rect = Rect(*cell)
+                    client.reset_size()
+        return self.cells
+
+    def edges(self, start, length, sizes, count):
+        # return count + 1 pixel edges, last edge is exactly at the end
+        if not sizes or len(sizes) != count:
+            sizes = [1.0 / count] * count
+        result = [start]
+        total = 0.0
+        for size in sizes[:-1]:
+            total += size
+            result.append(start + int(length * total))
+        result.append(start + length)
+        return result
+
+    def neighbour(self, direction):
+        # return index of neighbouring cell of focused client or None
+        if len(self.clients) == 0:
+            return None
+        columns, rows = self.grid_size()
+        row, column = divmod(self.client_focus, columns)
+        if direction == 'left' and column > 0:
+            return self.client_focus - 1
+        if direction == 'right' and column < columns - 1 and \
+                self.client_focus < len(self.clients) - 1:
+            return self.client_focus + 1
+        if direction == 'up' and row > 0:
+            return self.client_focus - columns
+        if direction == 'down' and row < rows - 1:
+            return min(self.client_focus + columns, len(self.clients) - 1)
+
+    def focus_left(self):
+        index = self.neighbour('left')
+        if index is not None:
+            self.client_focus = index
+            return self.focused_client()
+        else:
+            return DynamicBaseLayout.focus_left(self)
+
+    def focus_right(self):
+        index = self.neighbour('right')
+        if index is not None:
+            self.client_focus = index
+            return self.focused_client()
+        else:
+            return DynamicBaseLayout.focus_right(self)
+
+    def focus_up(self):
+        index = self.neighbour('up')
+        if index is not None:
+            self.client_focus = index
+            return self.focused_client()
+        else:
+            return DynamicBaseLayout.focus_up(self)
+
+    def focus_down(self):
+        index = self.neighbour('down')
+        if index is not None:
+            self.client_focus = index
+            return self.focused_client()
+        else:
+            return DynamicBaseLayout.focus_down(self)
+
+    def swap(self, index):
+        # swap focused element with element at index
+        self.clients[self.client_focus], self.clients[index] = \
+                self.clients[index], self.clients[self.client_focus]
+        self.client_focus = index
+        self.cells_key = None
+        return self.focused_client()
+
+    def shuffle_client_left(self, client=None):
+        index = self.neighbour('left')
+        if index is not None:
+            return self.swap(index)
+        else:
+            return DynamicBaseLayout.shuffle_client_left(self, client)
+
+    def shuffle_client_right(self, client=None):
+        index = self.neighbour('right')
+        if index is not None:
+            return self.swap(index)
+        else:
+            return DynamicBaseLayout.shuffle_client_right(self, client)
+
+    def shuffle_client_up(self, client=None):
+        index = self.neighbour('up')
+        if index is not None:
+            return self.swap(index)
+        else:
+            return DynamicBaseLayout.shuffle_client_up(self, client)
+
+    def shuffle_client_down(self, client=None):
+        index = self.neighbour('down')
+        if index is not None:
+            return self.swap(index)
+        else:
+            return DynamicBaseLayout.shuffle_client_down(self, client)
+
+    def resize(self, x, y):
+        if not self.rect or len(self.clients) == 0:
+            return
+        columns, rows = self.grid_size()
+        row, column = divmod(self.client_focus, columns)
+        self.column_sizes = self.resized_sizes(
+                self.column_sizes, columns, column, x / self.rect.width)
+        self.row_sizes = self.resized_sizes(
+                self.row_sizes, rows, row, y / self.rect.height)
+
+    def resized_sizes(self, sizes, count, index, delta):
+        # grow size at index by delta, others shrink proportionally
+        if not sizes or len(sizes) != count:
+            sizes = [1.0 / count] * count
+        size = sizes[index] + delta
+        if delta == 0 or count < 2 or size <= 0 or size >= 1:
+            return sizes
+        ratio = (1.0 - size) / (1.0 - sizes[index])
+        return [size if i == index else s * ratio for i, s in enumerate(sizes)]
+
+    def reset_size(self):
+        self.column_sizes = None
+        self.row_sizes = None
+        self.cells_key = None
+        DynamicBaseLayout.reset_size(self)
+
+    def layout_state(self):
+        return (
+            tuple(self.column_sizes) if self.column_sizes else None,
+            tuple(self.row_sizes) if self.row_sizes else None)
+
+    def set_layout_state(self, state):
+        column_sizes, row_sizes = state
+        self.column_sizes = list(column_sizes) if column_sizes else None
+        self.row_sizes = list(row_sizes) if row_sizes else None
+        # restored children may have the rects of other cells
+        self.cells_key = None
+
+    def left_layout(self):
+        index = self.neighbour('left')
+        if index is not None:
+            left_client = self.clients[index]
+            if isinstance(left_client, DynamicBaseLayout):
+                return left_client
+        else:
+            return DynamicBaseLayout.left_layout(self)
+
+    def right_layout(self):
+        index = self.neighbour('right')
+        if index is not None:
+            right_client = self.clients[index]
+            if isinstance(right_client, DynamicBaseLayout):
+                return right_client
+        else:
+            return DynamicBaseLayout.right_layout(self)
+
+    def up_layout(self):
+        index = self.neighbour('up')
+        if index is not None:
+            up_client = self.clients[index]
+            if isinstance(up_client, DynamicBaseLayout):
+                return up_client
+        else:
+            return DynamicBaseLayout.up_layout(self)
+
+    def down_layout(self):
+        index = self.neighbour('down')
+        if index is not None:
+            down_client = self.clients[index]
+            if isinstance(down_client, DynamicBaseLayout):
+                return down_client
+        else:
+            return DynamicBaseLayout.down_layout(self)
+
+class TabBar:
+    '''
+    Tab bar of a tabs layout
+    Tabs are drawn into a pixmap which is kept between draws,
+    only tabs whose title or focus changed are drawn again.
+    '''
+
+    def __init__(self, qtile, config):
+        self.qtile = qtile
+        self.config = config
+        self.panel = None
+        self.drawer = None
+        self.text = None
+        self.rect = None
+        # titles and focus as drawn into the pixmap
+        self.titles = []
+        self.client_focus = None
+
+    def update(self, rect, titles, client_focus):
+        if rect != self.rect:
+            self.resize(rect)
+        if len(titles) != len(self.titles):
+            # tab widths changed, everything moves
+            self.titles = [None] * len(titles)
+        for index, title in enumerate(titles):
+            if title != self.titles[index] or \
+                    (index == client_focus) != (index == self.client_focus):
+                self.titles[index] = title
+                self.draw_tab(index, index == client_focus)
+        self.client_focus = client_focus
+        if self.panel.hidden:
+            self.panel.unhide()
+
+    def update_title(self, index, title):
+        if self.panel and index < len(self.titles) and \
+                title != self.titles[index]:
+            self.titles[index] = title
+            self.draw_tab(index, index == self.client_focus)
+
+    def resize(self, rect):
+        x, y, width, height = rect
+        if not self.panel:
+            self.panel = Internal.create(self.qtile, x, y, width, height)
+            self.panel.handle_Expose = self.handle_Expose
+            self.qtile.windows_map[self.panel.window.wid] = self.panel
+        else:
+            self.panel.place(x, y, width, height, 0, None)
+        if not self.rect or self.rect[2:] != rect[2:]:
+            if self.drawer:
+                self.text.finalize()
+                self.drawer.finalize()
+            self.drawer = drawer.Drawer(
+                    self.qtile, self.panel.window.wid, width, height)
+            self.drawer.clear(self.config['background'])
+            self.text = self.drawer.textlayout(
+                    '',
+                    self.config['foreground'],
+                    self.config['font'],
+                    self.config['fontsize'],
+                    None,
+                    wrap=False)
+            self.titles = []
+        self.rect = rect
+
+    def tab_edges(self, index):
+        width = self.rect[2]
+        return (
+            width * index // len(self.titles),
+            width * (index + 1) // len(self.titles))
+
+    def draw_tab(self, index, focused):
+        start, end = self.tab_edges(index)
+        height = self.rect[3]
+        padding = self.config['padding']
+        self.drawer.set_source_rgb(self.config['active_background']
+                if focused else self.config['background'])
+        self.drawer.fillrect(start, 0, end - start, height, 0)
+        self.text.text = self.titles[index]
+        self.text.width = max(end - start - 2 * padding, 1)
+        self.text.draw(start + padding, (height - self.text.height) // 2)
+        self.copy(start, end - start)
+
+    def copy(self, x, width):
+        # copy part of the pixmap to the panel
+        self.qtile.conn.conn.core.CopyArea(
+            self.drawer.pixmap,
+            self.drawer.wid,
+            self.drawer.gc,
+            x, 0,
+            x, 0,
+            width, self.rect[3])
+
+    def handle_Expose(self, event):
+        self.copy(0, self.rect[2])
+
+    def hide(self):
+        if self.panel and not self.panel.hidden:
+            self.panel.hide()
+
+    def kill(self):
+        if self.panel:
+            self.text.finalize()
+            self.drawer.finalize()
+            self.qtile.windows_map.pop(self.panel.window.wid, None)
+            self.panel.kill()
+            self.panel = None
+
+
 class TabsLayout(DynamicBaseLayout):
 
     def configure(self, client, screen):
         if not self.rect:
             self.rect = Rect(screen.x, screen.y, screen.width, screen.height)
+        bar_height = self.root_layout.tab_bar_height
+        if bar_height:
+            self.root_layout.show_tab_bar(self)
+            screen = ScreenRect(
+                self.rect.x,
+                self.rect.y + bar_height,
+                self.rect.width,
+                self.rect.height - bar_height)
         if self.clients[self.client_focus] == client:
-            client.place(
+            self.root_layout.place_client(
+                client,
                 self.rect.x,
-                self.rect.y,
+                self.rect.y + bar_height,
                 self.rect.width,
-                self.rect.height,
-                0,
-                None)
-            client.unhide()
+                self.rect.height - bar_height)
             return
         else:
             layout = self.clients[self.client_focus]
@@ -676,7 +1401,7 @@ class TabsLayout(DynamicBaseLayout):
                 if layout.client_layout(client):
                     layout.configure(client, screen)
                     return
-        client.hide()
+        self.root_layout.hide_client(client)
 
     def focus_left(self):
         if self.client_focus > 0:
@@ -714,37 +1439,436 @@ class TabsLayout(DynamicBaseLayout):
 
 DefaultLayout = TabsLayout
 
+# tree of every group is written here on qtile restart,
+# one file per user and display
+restart_file = os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir()),
+        'qtile-simpledynamic-{}{}.yaml'.format(os.getuid(),
+            os.environ.get('DISPLAY', '').replace('/', '_')))
+restart_trees = None
+root_layouts = weakref.WeakSet()
+
+def load_restart_trees():
+    # return trees saved before restart,
+    # by group name and index of the layout in the group
+    global restart_trees
+    if restart_trees is None:
+        restart_trees = {}
+        try:
+            fd = os.open(restart_file, os.O_RDONLY | os.O_NOFOLLOW)
+        except OSError:
+            return restart_trees
+        with os.fdopen(fd, 'r') as file:
+            # the temp dir is shared, only trust files of this user
+            if os.fstat(fd).st_uid == os.getuid():
+                try:
+                    restart_trees = yaml.safe_load(file) or {}
+                except yaml.YAMLError:
+                    logger.exception('could not read %s', restart_file)
+                os.remove(restart_file)
+    return restart_trees
+
+def save_restart_trees(trees):
+    # create the file new, not following links,
+    # a file left under the name before is replaced
+    try:
+        os.remove(restart_file)
+    except FileNotFoundError:
+        pass
+    fd = os.open(restart_file,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+    with os.fdopen(fd, 'w') as file:
+        yaml.dump(trees, file)
+
+@hook.subscribe.startup_complete
+def finish_restores():
+    for layout in list(root_layouts):
+        layout.finish_restore()
+
+@hook.subscribe.client_name_updated
+def update_titles(window):
+    for layout in list(root_layouts):
+        if window in layout.window_index:
+            layout.index_title(window)
+            layout.update_tab_titles(layout.window_index[window])
+
+layout_classes = {
+    'HorizontalLayout': HorizontalLayout,
+    'VerticalLayout': VerticalLayout,
+    'GridLayout': GridLayout,
+    'TabsLayout': TabsLayout
+}
+
 class SimpleDynamic(DynamicBaseLayout):
 
+    # replaced by headless benchmarks
+    tab_bar_class = TabBar
+
     defaults = [
-        ("default_layout", TabsLayout, "Default layout class")
+        ("default_layout", TabsLayout, "Default layout class"),
+        ("undo_limit", 50, "Number of commands which can be undone"),
+        ("template", None,
+            "Tree like in saved yaml files or yaml file name, "
+            "arrangement every group starts with"),
+        ("placement_rules", [],
+            "PlacementRule list, puts new windows into tagged layouts"),
+        ("focus_history_size", 100,
+            "Number of recently focused windows remembered"),
+        ("tab_bar_height", 0,
+            "Height of the bar listing the tabs of tabs layouts, "
+            "0 shows no bars"),
+        ("tab_bar_font", "sans", "Tab bar font"),
+        ("tab_bar_fontsize", 12, "Tab bar font size"),
+        ("tab_bar_padding", 4, "Space left and right of tab titles"),
+        ("tab_bar_foreground", "ffffff", "Tab title colour"),
+        ("tab_bar_background", "222222", "Tab colour"),
+        ("tab_bar_active_background", "215578", "Focused tab colour")
     ]
 
     def __init__(self, **config):
         DynamicBaseLayout.__init__(self, **config)
         self.root_layout = self
         self.add_defaults(SimpleDynamic.defaults)
+        self.undo_history = collections.deque(maxlen=self.undo_limit)
+        self.redo_history = collections.deque(maxlen=self.undo_limit)
+        self.snapshots = {}
+        self.restored_windows = {}
+        # set from restart until startup is complete
+        self.restore_pending = False
+        self.tagged_layouts = weakref.WeakValueDictionary()
+        self.placement = PlacementRules(self.placement_rules)
+        # windows, most recently focused last,
+        # wrappers are looked up in window_index as they may be replaced
+        self.focus_history = collections.OrderedDict()
+        self.clear_index()
+        # tabs layouts to their tab bars
+        self.tab_bars = weakref.WeakKeyDictionary()
+        # geometry changes of the running layout pass
+        self.geometry_batch = None
+        # parsed once, shared read only by all groups
+        self.template_snapshot = None
+        if self.template is not None:
+            tree = self.template
+            if isinstance(tree, str):
+                with open(os.path.expanduser(tree), 'r') as file:
+                    tree = yaml.safe_load(file)
+            self.template_snapshot = self.template_from_tree(tree)
 
     def clone(self, group):
         c = DynamicBaseLayout.clone(self, group)
         c.root_layout = c
         c.default_layout = self.default_layout
+        c.undo_history = collections.deque(maxlen=self.undo_limit)
+        c.redo_history = collections.deque(maxlen=self.undo_limit)
+        c.snapshots = {}
+        c.tagged_layouts = weakref.WeakValueDictionary()
+        c.focus_history = collections.OrderedDict()
+        c.clear_index()
+        c.tab_bars = weakref.WeakKeyDictionary()
+        # the group gets its own copy of the template on first use
+        c.pending_template = self.template_snapshot
+        c.restored_windows = {}
+        c.restore_pending = False
+        # groups can have more than one SimpleDynamic
+        c.restart_index = len([layout for layout in root_layouts
+                               if layout.group is group])
+        restart_tree = load_restart_trees().get(group.name, {}).pop(
+                c.restart_index, None)
+        if restart_tree:
+            c.restore_pending = True
+            # built right away, so restored_windows is filled
+            # before the first window comes back
+            c.pending_template = None
+            c.instantiate(self.template_from_tree(
+                    restart_tree['tree'], restart_tree['focus']))
+        root_layouts.add(c)
         return c
 
+    @property
+    def clients(self):
+        if self.pending_template:
+            template = self.pending_template
+            self.pending_template = None
+            self.instantiate(template)
+        return self._clients
+
+    @clients.setter
+    def clients(self, clients):
+        self.pending_template = None
+        self._clients = clients
+
+    def tag_layout(self, layout, tag):
+        # a tag names one layout, the one tagged before loses it
+        previous = self.tagged_layouts.get(tag)
+        if previous is not None and previous is not layout and \
+                previous.tag == tag:
+            previous.tag = None
+        layout.tag = tag
+        self.tagged_layouts[tag] = layout
+
+    def tagged_layout(self, tag):
+        # return layout with tag if it is still in the tree
+        layout = self.tagged_layouts.get(tag)
+        if layout and layout.tag == tag and layout.is_attached():
+            return layout
+
+    def placement_layout(self, client):
+        # return layout for new window client from placement rules
+        rule = self.placement.match(client)
+        if rule:
+            return self.tagged_layout(rule.tag)
+
+    def template_from_tree(self, tree, focus=0):
+        # return template snapshot of a tree as written by cmd_save_yaml
+        return LayoutSnapshot(None, type(self), None, None, focus,
+                self.template_clients(tree, type(self)))
+
+    def template_clients(self, tree, layout_class):
+        clients = []
+        for sub_tree in tree:
+            if 'class_name' in sub_tree:
+                window = WindowSnapshot(None,
+                        parse_class_name(sub_tree['class_name']),
+                        sub_tree.get('wid'))
+                if not issubclass(layout_class, self.default_layout):
+                    window = LayoutSnapshot(None, self.default_layout,
+                            None, None, 0, (window,))
+                clients.append(window)
+                continue
+            layout_name = list(sub_tree.keys())[0]
+            if layout_name not in layout_classes:
+                continue
+            sub_layout_class = layout_classes[layout_name]
+            rect = None
+            if 'rect' in sub_tree:
+                rect = sub_tree['rect']
+                if 'x' in rect and 'y' in rect and \
+                        'width' in rect and 'height' in rect:
+                    rect = (rect['x'], rect['y'], rect['width'], rect['height'])
+                else:
+                    rect = None
+            state = None
+            if sub_layout_class is GridLayout:
+                state = (sub_tree.get('column_sizes'), sub_tree.get('row_sizes'))
+            clients.append(LayoutSnapshot(None, sub_layout_class, rect, state,
+                    sub_tree.get('focus', 0),
+                    self.template_clients(sub_tree[layout_name],
+                        sub_layout_class),
+                    sub_tree.get('tag')))
+        return tuple(clients)
+
+    def snapshot(self):
+        # return snapshot of the whole tree,
+        # sharing unchanged subtrees with the last one
+        current = {}
+        result = DynamicBaseLayout.snapshot(self, self.snapshots, current)
+        self.snapshots = current
+        return result
+
+    def record(self):
+        # remember current tree before a command changes it
+        self.undo_history.append(self.snapshot())
+        self.redo_history.clear()
+
+    def apply_snapshot(self, snapshot):
+        # restore tree from snapshot and relayout changed windows only
+        old_placements = self.placements()
+        focused_client = self.focused_client()
+        windows = {}
+        for client in self.all_windows():
+            if client.window:
+                windows[client.window] = client
+        dropped = self.restore(snapshot, windows)
+        # windows opened after the snapshot was taken
+        for client in windows.values():
+            if len(self.clients) == 0:
+                layout = self.default_layout()
+                layout.root_layout = self
+                DynamicBaseLayout.add(self, layout)
+            self.focused_layout().add(client)
+        self.cleanup()
+        if dropped:
+            # sizes were saved for the closed windows too,
+            # recompute them like remove does
+            self.reset_size()
+        self.clear_index()
+        for client in self.all_windows():
+            if client.window:
+                self.index_window(client)
+        new_placements = self.placements()
+        changed = [window for window, placement in new_placements.items()
+                   if old_placements.get(window) != placement]
+        client = self.focused_client()
+        if client and client != focused_client and client.window:
+            self.group.focus(client.window, True)
+        elif changed and self.group.screen:
+            self.layout(changed, self.group.screen.get_rect())
+
+    def cmd_undo(self):
+        if len(self.undo_history) == 0:
+            return
+        self.redo_history.append(self.snapshot())
+        self.apply_snapshot(self.undo_history.pop())
+        print(self)
+
+    def cmd_redo(self):
+        if len(self.redo_history) == 0:
+            return
+        self.undo_history.append(self.snapshot())
+        self.apply_snapshot(self.redo_history.pop())
+        print(self)
+
     def configure(self, client, screen):
         for layout in self.clients:
             if isinstance(layout, DynamicBaseLayout):
                 if layout.client_layout(client):
                     layout.configure(client, screen)
 
+    def layout(self, windows, screen):
+        # collect geometry of all windows, then send it at once
+        self.geometry_batch = ({}, [], {})
+        try:
+            Layout.layout(self, windows, screen)
+        finally:
+            places, hides, tab_layouts = self.geometry_batch
+            self.geometry_batch = None
+        self.flush_geometry(places, hides)
+        if self.tab_bar_height:
+            self.update_tab_bars(tab_layouts)
+
+    def place_client(self, client, x, y, width, height):
+        if self.geometry_batch:
+            self.geometry_batch[0][client] = (x, y, width, height)
+        else:
+            client.place(x, y, width, height, 0, None)
+            client.unhide()
+
+    def hide_client(self, client):
+        if self.geometry_batch:
+            self.geometry_batch[1].append(client)
+        else:
+            client.hide()
+
+    def show_tab_bar(self, layout):
+        if self.geometry_batch:
+            self.geometry_batch[2][layout] = True
+        else:
+            self.update_tab_bar(layout)
+
+    def update_tab_bars(self, tab_layouts):
+        # a pass may lay out only some windows, bars of other tabs
+        # are hidden only if they are behind another tab,
+        # tabs which left the tree may still be held by the undo history,
+        # their bars are killed and made again if they come back
+        for layout, tab_bar in list(self.tab_bars.items()):
+            if not layout.is_attached():
+                tab_bar.kill()
+                del self.tab_bars[layout]
+            elif layout not in tab_layouts and not self.is_visible(layout):
+                tab_bar.hide()
+        for layout in tab_layouts:
+            self.update_tab_bar(layout)
+
+    def is_visible(self, layout):
+        if not layout.is_attached():
+            return False
+        child = layout
+        layout = layout.parent
+        while layout:
+            if isinstance(layout, TabsLayout) and \
+                    layout.clients[layout.client_focus] is not child:
+                return False
+            child = layout
+            layout = layout.parent
+        return True
+
+    def update_tab_bar(self, layout):
+        qtile = getattr(self.group, 'qtile', None)
+        if not qtile:
+            return
+        tab_bar = self.tab_bars.get(layout)
+        if not tab_bar:
+            tab_bar = self.tab_bar_class(qtile, {
+                'font': self.tab_bar_font,
+                'fontsize': self.tab_bar_fontsize,
+                'padding': self.tab_bar_padding,
+                'foreground': self.tab_bar_foreground,
+                'background': self.tab_bar_background,
+                'active_background': self.tab_bar_active_background})
+            self.tab_bars[layout] = tab_bar
+            # the bar window goes away with its layout
+            weakref.finalize(layout, tab_bar.kill)
+        tab_bar.update(
+            (layout.rect.x, layout.rect.y,
+                layout.rect.width, self.tab_bar_height),
+            [self.tab_title(client) for client in layout.clients],
+            layout.client_focus)
+
+    def tab_title(self, client):
+        if isinstance(client, DynamicBaseLayout):
+            client = client.focused_client()
+        if not client:
+            return ''
+        if client.window:
+            return client.window.name or ''
+        return class_name(client.wm_class)
+
+    def update_tab_titles(self, client):
+        # redraw only the tabs showing the title of client
+        child = client
+        layout = client.parent
+        while layout:
+            tab_bar = self.tab_bars.get(layout)
+            if tab_bar:
+                tab_bar.update_title(
+                    layout.clients.index(child), self.tab_title(child))
+            if layout.clients[layout.client_focus] is not child:
+                break
+            child = layout
+            layout = layout.parent
+
+    def hide(self):
+        for tab_bar in self.tab_bars.values():
+            tab_bar.hide()
+
+    def flush_geometry(self, places, hides):
+        # hide first and show last, shrinking windows move before
+        # growing ones, so windows never overlap in between
+        for client in hides:
+            if not client.hidden:
+                client.hide()
+        changes = []
+        for client, geometry in places.items():
+            if (client.x, client.y, client.width, client.height) != geometry:
+                growth = geometry[2] * geometry[3] - \
+                        (client.width or 0) * (client.height or 0)
+                changes.append((growth, client, geometry))
+        changes.sort(key=lambda change: change[0])
+        for growth, client, geometry in changes:
+            client.place(*geometry, 0, None)
+        for client in places:
+            if client.hidden:
+                client.unhide()
+        qtile = getattr(self.group, 'qtile', None)
+        if qtile:
+            qtile.conn.flush()
+
     def add(self, client):
         print('add')
         print(client)
+        if isinstance(client, Window) and self.restored_windows:
+            # window managed before restart, takes its old place
+            restored_client = self.restored_windows.pop(client.window.wid, None)
+            if restored_client:
+                restored_client.window = client
+                self.index_window(restored_client)
+                return
         if isinstance(client, Window):
             # check for empty window wrapper with wm_class
             free_client = self.free_client_by_class(client.window.get_wm_class())
             if free_client:
                 free_client.window = client
+                self.index_window(free_client)
                 print('found reserved space for client')
                 print(self)
                 return
@@ -754,33 +1878,237 @@ class SimpleDynamic(DynamicBaseLayout):
             layout.root_layout = self
             DynamicBaseLayout.add(self, layout)
         if isinstance(client, Window):
-            self.focused_layout().add(WindowWrapper(client))
+            layout = self.placement_layout(client)
+            if layout and not isinstance(layout, self.default_layout):
+                # new cell, siblings are resized
+                layout.reset_size()
+            layout = layout or self.focused_layout()
+            client = WindowWrapper(client)
+            layout.add(client)
         else:
             self.focused_layout().add(client)
+        if isinstance(client, WindowWrapper) and client.window:
+            self.index_window(client)
         self.group.layout_all()
         print(self)
 
+    def focus(self, client):
+        # keep focus path of restart until startup is complete,
+        # windows coming back are focused one by one
+        if self.restore_pending:
+            return
+        client = self.window_index.get(client, client)
+        if not self.focus_wrapper(client):
+            DynamicBaseLayout.focus(self, client)
+        self.remember_focus(self.focused_client())
+
+    def focus_wrapper(self, client):
+        # set focus path bottom up from window wrapper client,
+        # false if its parent reference is out of date
+        if not isinstance(client, WindowWrapper):
+            return False
+        layout = client.parent
+        if not layout or client not in layout.clients or \
+                not layout.is_attached():
+            return False
+        while layout:
+            layout.client_focus = layout.clients.index(client)
+            client = layout
+            layout = layout.parent
+        return True
+
+    def remember_focus(self, client):
+        if not client or not client.window:
+            return
+        self.focus_history.pop(client.window, None)
+        self.focus_history[client.window] = None
+        if len(self.focus_history) > self.focus_history_size:
+            self.focus_history.popitem(last=False)
+
+    def last_focused(self, offset=0):
+        # return wrapper focused offset focus changes ago or None
+        for window in reversed(self.focus_history):
+            if offset == 0:
+                return self.window_index.get(window)
+            offset -= 1
+
+    def clear_index(self):
+        # windows to wrappers
+        self.window_index = {}
+        # instance and class names to ordered dicts of windows to wrappers
+        self.class_index = {}
+        # sorted lower case titles with window ids for prefix search
+        self.titles = []
+        self.title_windows = {}
+        self.window_titles = {}
+
+    def index_window(self, client):
+        self.unindex_window(client.window)
+        self.window_index[client.window] = client
+        for name in client.wm_class or ():
+            self.class_index.setdefault(name, collections.OrderedDict())
+            self.class_index[name][client.window] = client
+        self.index_title(client.window)
+
+    def unindex_window(self, window):
+        client = self.window_index.pop(window, None)
+        if not client:
+            return
+        for name in client.wm_class or ():
+            windows = self.class_index.get(name)
+            if windows is not None:
+                windows.pop(window, None)
+                if len(windows) == 0:
+                    del self.class_index[name]
+        self.unindex_title(window)
+
+    def index_title(self, window):
+        self.unindex_title(window)
+        key = ((window.name or '').lower(), window.window.wid)
+        bisect.insort(self.titles, key)
+        self.title_windows[key] = window
+        self.window_titles[window] = key
+
+    def unindex_title(self, window):
+        key = self.window_titles.pop(window, None)
+        if key is None:
+            return
+        index = bisect.bisect_left(self.titles, key)
+        if index < len(self.titles) and self.titles[index] == key:
+            del self.titles[index]
+        del self.title_windows[key]
+
+    def windows_by_title(self, prefix):
+        # yield windows whose title starts with prefix, ignoring case
+        prefix = prefix.lower()
+        index = bisect.bisect_left(self.titles, (prefix,))
+        while index < len(self.titles) and \
+                self.titles[index][0].startswith(prefix):
+            yield self.title_windows[self.titles[index]]
+            index += 1
+
+    def focus_window_of(self, windows):
+        # focus window after the focused one of windows, or the first one
+        client = self.focused_client()
+        focused = client.window if client else None
+        first = None
+        found = False
+        for window in windows:
+            if found:
+                first = window
+                break
+            if window is focused:
+                found = True
+            elif first is None:
+                first = window
+        if first is not None:
+            self.group.focus(first, True)
+
+    def cmd_focus_by_class(self, wm_class):
+        # cycle through windows with instance or class name wm_class
+        self.focus_window_of(self.class_index.get(wm_class, ()))
+
+    def cmd_focus_by_title(self, title):
+        # cycle through windows whose title starts with title
+        self.focus_window_of(self.windows_by_title(title))
+
+    def cmd_focus_last(self):
+        # focus previously focused window
+        client = self.last_focused(1)
+        if client and self.focus_wrapper(client):
+            self.group.focus(client.window, True)
+
+    def finish_restore(self):
+        # drop space of windows which did not come back after restart
+        # and focus the window focused before
+        if not self.restore_pending:
+            return
+        self.restore_pending = False
+        if self.restored_windows:
+            self.remove_windows(set(map(id, self.restored_windows.values())))
+            self.restored_windows = {}
+            self.cleanup()
+        client = self.focused_client()
+        if client and client.window:
+            self.group.focus(client.window, True)
+        else:
+            self.group.layout_all()
+
+    def restart_state(self):
+        # tree with window ids and focus path,
+        # None if it fails, other groups are still saved
+        try:
+            return {
+                'focus': self.client_focus,
+                'tree': self.to_tree(self, True)
+            }
+        except Exception:
+            logger.exception('could not save group %s', self.group.name)
+
+    def finalize(self):
+        qtile = None
+        for layout in root_layouts:
+            qtile = layout.group.qtile
+            break
+        # qtile only sets _restart when it is about to re-exec itself
+        if getattr(qtile, '_restart', None):
+            trees = {}
+            for layout in root_layouts:
+                state = layout.restart_state()
+                if state:
+                    trees.setdefault(layout.group.name, {})[
+                            layout.restart_index] = state
+            try:
+                save_restart_trees(trees)
+            except OSError:
+                logger.exception('could not write %s', restart_file)
+        for layout in root_layouts:
+            for tab_bar in layout.tab_bars.values():
+                tab_bar.kill()
+        DynamicBaseLayout.finalize(self)
+
+    def cmd_tag(self, tag, depth=0):
+        # tag focused layout or its parent depth levels up
+        # as target for placement rules
+        layout = self.focused_layout()
+        for _ in range(depth):
+            if layout.parent and layout.parent != self:
+                layout = layout.parent
+        if layout == self:
+            return
+        self.record()
+        self.tag_layout(layout, tag)
+
+    def focus_client(self, client):
+        # a free place has no window for qtile to focus,
+        # the group is laid out to show its tab instead
+        if client.window:
+            self.group.focus(client.window, True)
+        else:
+            self.group.layout_all()
+
     def cmd_focus_left(self):
         client = self.focused_layout().focus_left()
         if client:
-            self.group.focus(client.window, True)
+            self.focus_client(client)
 
     def cmd_focus_right(self):
         client = self.focused_layout().focus_right()
         if client:
-            self.group.focus(client.window, True)
+            self.focus_client(client)
 
     def cmd_focus_up(self):
         client = self.focused_layout().focus_up()
         if client:
-            self.group.focus(client.window, True)
+            self.focus_client(client)
 
     def cmd_focus_down(self):
         client = self.focused_layout().focus_down()
         if client:
-            self.group.focus(client.window, True)
+            self.focus_client(client)
 
     def cmd_shuffle_left(self):
+        self.record()
         client = self.focused_layout().shuffle_client_left()
         self.cleanup()
         self.reset_size()
@@ -790,6 +2118,7 @@ class SimpleDynamic(DynamicBaseLayout):
         print(self)
 
     def cmd_shuffle_right(self):
+        self.record()
         client = self.focused_layout().shuffle_client_right()
         self.cleanup()
         self.reset_size()
@@ -799,6 +2128,7 @@ class SimpleDynamic(DynamicBaseLayout):
         print(self)
 
     def cmd_shuffle_up(self):
+        self.record()
         client = self.focused_layout().shuffle_client_up()
         self.cleanup()
         self.reset_size()
@@ -808,6 +2138,7 @@ class SimpleDynamic(DynamicBaseLayout):
         print(self)
 
     def cmd_shuffle_down(self):
+        self.record()
         client = self.focused_layout().shuffle_client_down()
         self.cleanup()
         self.reset_size()
@@ -816,38 +2147,71 @@ class SimpleDynamic(DynamicBaseLayout):
             self.group.focus(client.window, True)
         print(self)
 
+    def cmd_grid(self):
+        # place all windows of focused tabs in a grid
+        layout = self.focused_layout()
+        if not isinstance(layout, self.default_layout) or \
+                len(layout.clients) < 2:
+            return
+        self.record()
+        client = self.focused_client()
+        grid_layout = GridLayout()
+        layout.parent.replace(layout, grid_layout)
+        for window in layout.clients:
+            grid_layout.add_end(window)
+        self.focus(client)
+        self.group.layout_all()
+        print(self)
+
     def cmd_resize(self, x, y):
+        self.record()
         self.focused_layout().resize(x, y)
         self.group.layout_all()
         print(self)
 
     def cmd_reset_size(self):
+        self.record()
         self.reset_size()
         self.group.layout_all()
         print(self)
 
-    def to_tree(self, o):
+    def to_tree(self, o, state=False):
+        # state adds window ids and focus path
         if isinstance(o, WindowWrapper):
-            return {
-                'class_name': o.wm_class[0] + ' - ' + o.wm_class[1]
+            tree = {
+                'class_name': class_name(o.wm_class)
             }
+            if state and o.window:
+                tree['wid'] = o.window.window.wid
+            return tree
         else:
             client_list = []
             for client in o.clients:
-                client_list.append(self.to_tree(client))
+                client_list.append(self.to_tree(client, state))
             layout_name = str(o.__class__.__name__)
             if isinstance(o, SimpleDynamic):
                 return client_list
             else:
-                return {
-                    layout_name: client_list,
-                    'rect': {
+                tree = {
+                    layout_name: client_list
+                }
+                if o.rect:
+                    tree['rect'] = {
                         'x': o.rect.x,
                         'y': o.rect.y,
                         'width': o.rect.width,
                         'height': o.rect.height
                     }
-                }
+                if o.tag is not None:
+                    tree['tag'] = o.tag
+                if state:
+                    tree['focus'] = o.client_focus
+                if isinstance(o, GridLayout):
+                    if o.column_sizes:
+                        tree['column_sizes'] = list(o.column_sizes)
+                    if o.row_sizes:
+                        tree['row_sizes'] = list(o.row_sizes)
+                return tree
 
     def add_from_tree(self, parent, tree):
         if isinstance(tree, list):
@@ -857,18 +2221,19 @@ class SimpleDynamic(DynamicBaseLayout):
             if 'class_name' in tree:
                 # window wrapper
                 window = WindowWrapper(None)
-                window.wm_class = tuple(tree['class_name'].split(' - '))
+                window.wm_class = parse_class_name(tree['class_name'])
                 parent.add(window)
             else:
                 # layout
                 layout_name = list(tree.keys())[0]
                 layout = None
-                if layout_name == 'HorizontalLayout':
-                    layout = HorizontalLayout()
-                elif layout_name == 'VerticalLayout':
-                    layout = VerticalLayout()
-                elif layout_name == 'TabsLayout':
-                    layout = TabsLayout()
+                if layout_name in layout_classes:
+                    layout = layout_classes[layout_name]()
+                if isinstance(layout, GridLayout):
+                    layout.column_sizes = tree.get('column_sizes')
+                    layout.row_sizes = tree.get('row_sizes')
+                if layout and 'tag' in tree:
+                    self.tag_layout(layout, tree['tag'])
                 if 'rect' in tree:
                     if 'x' in tree['rect'] and \
                             'y' in tree['rect'] and \
@@ -889,12 +2254,21 @@ class SimpleDynamic(DynamicBaseLayout):
 
     def cmd_load_yaml(self, file_name):
         with open(file_name, 'r') as file:
-            tree = yaml.load(file)
+            tree = yaml.safe_load(file)
+            self.record()
+            focused_client = self.focused_client()
             all_windows = self.all_windows()
             self.clients = []
             self.add_from_tree(self, tree)
             for window in all_windows:
-                self.add(window.window)
+                # places of windows which never came are not carried over
+                if window.window:
+                    self.add(window.window)
+            # the window focused before the load keeps the focus
+            if focused_client and focused_client.window:
+                self.group.focus(focused_client.window, True)
+            else:
+                self.group.layout_all()
             print('loaded from {}'.format(file_name))
             print(self)
 
@@ -902,9 +2276,15 @@ class SimpleDynamic(DynamicBaseLayout):
         if isinstance(client, Window):
             if client.fullscreen:
                 return
+        self.focus_history.pop(client, None)
+        self.unindex_window(client)
         client = DynamicBaseLayout.remove(self, client)
         self.cleanup()
         self.reset_size()
+        # refocus the window used last instead of a neighbour
+        last_client = self.last_focused()
+        if last_client and self.focus_wrapper(last_client):
+            client = last_client
         self.group.layout_all()
         if client:
             self.group.focus(client.window, True)